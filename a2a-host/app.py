@@ -1,19 +1,34 @@
 # a2a-host/app.py
-import os, re, json, hmac, hashlib, base64, time
-from typing import List, Dict
+import os, re, json, hmac, hashlib, base64, time, asyncio
+from typing import List, Dict, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 # LLM + Tools + Agents
 from core import llm
 from core.mcp_client import call_tool
-from core.scheduler_agent_pyd import scheduler_agent  # keep existing Scheduler
+from core.scheduler_agent_pyd import schedule  # keep existing Scheduler
 # NEW: PydanticAI Planner
-from core.planner_agent import plan_sync
+from core.planner_agent import plan
 from core.models import MeetingPlan
+from core.deadline import Deadline, DeadlineExceeded
+from core import profiling
+from core.profiling import profiled
 
 app = FastAPI()
+profiling.install(app)  # opt-in request profiling (PROFILE_KEY / PROFILE_SAMPLE_RATE)
+
+# How often a running stage checks whether the client is still there
+DISCONNECT_POLL_S = 0.5
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(
+        status_code=504,
+        content={"detail": {"error": "deadline_exceeded", "stage": exc.stage}},
+    )
 
 # =========================
 # Models
@@ -96,6 +111,39 @@ def _verify_token(token: str) -> dict:
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
 
+def _deadline(x_deadline_ms: Optional[int]) -> Deadline:
+    try:
+        return Deadline.from_header(x_deadline_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _stage(request: Request, deadline: Deadline, stage: str, aw):
+    """
+    Await one pipeline stage. Cancels it (and skips everything after it)
+    when the budget runs out or the client disconnects.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while not task.done():
+            left = deadline.remaining()
+            if left <= 0:
+                raise DeadlineExceeded(stage)
+            await asyncio.wait({task}, timeout=min(left, DISCONNECT_POLL_S))
+            if not task.done() and await request.is_disconnected():
+                print(f"Client disconnected during {stage} after {deadline.elapsed_ms()}ms")
+                raise HTTPException(status_code=499, detail={"error": "client_disconnected", "stage": stage})
+        try:
+            return task.result()
+        except (DeadlineExceeded, HTTPException):
+            raise
+        except Exception as e:
+            # the stage's own timeout (set from the budget) may fire first
+            if deadline.expired():
+                raise DeadlineExceeded(stage) from e
+            raise
+    finally:
+        task.cancel()
+
 # =========================
 # Routes
 # =========================
@@ -104,19 +152,27 @@ def health():
     return {"ok": True}
 
 @app.post("/chat", response_model=ChatOut)
-def chat_endpoint(body: ChatIn):
+@profiled
+def chat_endpoint(body: ChatIn, x_deadline_ms: Optional[int] = Header(None)):
+    deadline = _deadline(x_deadline_ms)
     try:
         msgs = [
             {"role": "system", "content": "Be concise. One short sentence. Do not repeat the user text."},
             {"role": "user", "content": body.message}
         ]
-        reply_text = llm.chat(msgs)
+        reply_text = llm.chat(msgs, timeout=deadline.timeout("llm", cap=60))
         return {"reply": reply_text}
+    except DeadlineExceeded:
+        raise
     except Exception as e:
+        if deadline.expired():
+            raise DeadlineExceeded("llm")
         raise HTTPException(status_code=502, detail=f"LLM error: {e}")
 
 @app.post("/tool/create-event")
+@profiled
 def tool_create_event(body: CreateEventIn):
+    # Bookings are not cut off by the request deadline (see a2a_confirm)
     try:
         result = call_tool("calendar.create_event", body.dict())
         return {"tool_result": result}
@@ -124,20 +180,21 @@ def tool_create_event(body: CreateEventIn):
         raise HTTPException(status_code=502, detail=f"Tool error: {e}")
 
 @app.post("/a2a/dry-run")
-def a2a_dry_run(body: A2ADryIn):
+async def a2a_dry_run(body: A2ADryIn, request: Request, x_deadline_ms: Optional[int] = Header(None)):
     """
     Agent 1 (Planner) → JSON
     Agent 2 (Scheduler) ← Planner JSON → action JSON
     Returns both raw and parsed forms.
     """
+    deadline = _deadline(x_deadline_ms)
     # Agent 1 (PydanticAI): get a validated MeetingPlan
-    planner_parsed = plan_sync(body.prompt)
+    planner_parsed = await _stage(request, deadline, "planner", plan(body.prompt, deadline))
     # Provide a pretty "raw" string for visibility (keeps old shape)
     planner_raw = json.dumps(planner_parsed, indent=2)
 
     # Agent 2 (feed parsed JSON)
     scheduler_input = json.dumps(planner_parsed)
-    scheduler_raw = scheduler_agent(scheduler_input)
+    scheduler_raw = await _stage(request, deadline, "scheduler", schedule(scheduler_input, deadline))
     try:
         scheduler_parsed = _parse_json_from_md(scheduler_raw)
     except Exception:
@@ -149,19 +206,23 @@ def a2a_dry_run(body: A2ADryIn):
     }
 
 @app.post("/a2a/plan")
-def a2a_plan(body: A2APlanIn):
+async def a2a_plan(body: A2APlanIn, request: Request, x_deadline_ms: Optional[int] = Header(None)):
     """
     Planner → Scheduler → free/busy.
     If free, returns a signed confirm_token (no server memory).
+    The whole pipeline shares one deadline (X-Deadline-Ms header, or the
+    server default); running out returns 504 naming the stage.
     """
+    deadline = _deadline(x_deadline_ms)
+
     # Agent 1 (PydanticAI): validated MeetingPlan object as dict
-    planner_obj = plan_sync(body.prompt)
+    planner_obj = await _stage(request, deadline, "planner", plan(body.prompt, deadline))
 
     # default time_zone if missing
     planner_obj.setdefault("time_zone", body.time_zone)
 
     # Agent 2: Scheduler → action + args
-    scheduler_raw = scheduler_agent(json.dumps(planner_obj))
+    scheduler_raw = await _stage(request, deadline, "scheduler", schedule(json.dumps(planner_obj), deadline))
     try:
         scheduler_obj = _parse_json_from_md(scheduler_raw)
     except Exception:
@@ -188,11 +249,14 @@ def a2a_plan(body: A2APlanIn):
         raise HTTPException(status_code=400, detail=f"Unknown action: {action}")
 
     # Always check free/busy before booking
-    fb = call_tool("calendar.freebusy", {
+    # (requests is blocking: run it in a thread, bounded by the remaining budget).
+    # A disconnect stops us waiting, but the call already in flight - and the
+    # Google calls mcp-calendar makes for it - run on until the budget is spent.
+    fb = await _stage(request, deadline, "calendar.freebusy", asyncio.to_thread(call_tool, "calendar.freebusy", {
         "start": args["start"],
         "end": args["end"],
         "time_zone": args["time_zone"]
-    })
+    }, deadline))
 
     result = {
         "status": "free" if fb.get("free") else "busy",
@@ -212,9 +276,13 @@ def a2a_plan(body: A2APlanIn):
     return result
 
 @app.post("/a2a/confirm")
+@profiled
 def a2a_confirm(body: A2AConfirmIn):
     """
     Verify token → create event via tool server → return booking JSON.
+    Not bound by X-Deadline-Ms: Google may already have created the event when
+    a budget runs out, and a 504 would invite a retry that books it twice.
+    The booking keeps the plain 30s per-call timeouts instead.
     """
     # decode signed token to recover proposed args
     args = _verify_token(body.token)
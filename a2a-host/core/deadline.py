@@ -0,0 +1,59 @@
+import os, time
+from typing import Optional
+
+# Heroku's router gives up after 30s, so by default stop working a bit before that
+DEFAULT_DEADLINE_MS = int(os.environ.get("DEFAULT_DEADLINE_MS", "28000"))
+MAX_DEADLINE_MS = int(os.environ.get("MAX_DEADLINE_MS", "120000"))
+
+# Header used both by clients (→ a2a-host) and by a2a-host (→ mcp-calendar)
+DEADLINE_HEADER = "X-Deadline-Ms"
+# Budget held back from a downstream service, so it times out (and names its
+# stage) before our own timeout for the call fires
+DOWNSTREAM_HEADROOM_MS = int(os.environ.get("DOWNSTREAM_HEADROOM_MS", "300"))
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+class Deadline:
+    """
+    Per-request time budget. Created once at the edge and handed down to
+    every stage, which asks it for its remaining timeout.
+    """
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self._started = time.monotonic()
+        self._expires = self._started + budget_ms / 1000
+
+    @classmethod
+    def from_header(cls, value: Optional[int]) -> "Deadline":
+        budget_ms = DEFAULT_DEADLINE_MS if value is None else value
+        if budget_ms <= 0:
+            raise ValueError(f"{DEADLINE_HEADER} must be positive")
+        return cls(min(budget_ms, MAX_DEADLINE_MS))
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)."""
+        return max(0.0, self._expires - time.monotonic())
+
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self._started) * 1000)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, stage: str, cap: Optional[float] = None) -> float:
+        """
+        Timeout (seconds) for the next blocking call of `stage`.
+        Raises DeadlineExceeded if nothing is left.
+        """
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded(stage)
+        return min(left, cap) if cap else left
+
+    def headers(self) -> dict:
+        """Header carrying the remaining budget, less headroom, to a downstream service."""
+        downstream_ms = int(self.remaining() * 1000) - DOWNSTREAM_HEADROOM_MS
+        return {DEADLINE_HEADER: str(max(downstream_ms, 1))}
@@ -1,21 +1,40 @@
 import os, requests
+from typing import Optional
+
+from core.deadline import Deadline, DeadlineExceeded
 
 MCP_CAL_URL = os.environ["MCP_CAL_URL"].rstrip("/")
 TOOLS_KEY   = os.environ["TOOLS_KEY"]
 
-def call_tool(name: str, arguments: dict) -> dict:
+def call_tool(name: str, arguments: dict, deadline: Optional[Deadline] = None) -> dict:
     url = f"{MCP_CAL_URL}/tools/call"
     headers = {
         "Content-Type": "application/json",
         "X-Tool-Key": TOOLS_KEY
     }
+    timeout = 30
+    if deadline is not None:
+        # never wait longer than the caller will, and tell the tool server how long that is
+        timeout = deadline.timeout(name, cap=30)
+        headers.update(deadline.headers())
     payload = {"name": name, "arguments": arguments}
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=30)
+        r = requests.post(url, json=payload, headers=headers, timeout=timeout)
+        if r.status_code == 504 and deadline is not None:
+            # the tool server ran out of our budget; report the stage it gave up in
+            try:
+                detail = r.json().get("detail")
+            except ValueError:
+                detail = None
+            stage = detail.get("stage") if isinstance(detail, dict) else None
+            raise DeadlineExceeded(f"{name}:{stage}" if stage else name)
         r.raise_for_status()
         data = r.json()
         return data.get("content", data)
     except requests.exceptions.RequestException as e:
+        if deadline is not None and deadline.expired():
+            # out of budget is not the same as "busy"; don't fall back
+            raise DeadlineExceeded(name) from e
         print(f"Error calling tool {name}: {e}")
         print(f"URL: {url}")
         print(f"Payload: {payload}")
@@ -1,6 +1,8 @@
 import os
 from pydantic_ai import Agent
 from core.models import MeetingPlan
+from core.deadline import Deadline
+from typing import Optional
 import datetime
 
 # Bridge Heroku Inference → OpenAI-compatible env
@@ -28,13 +30,18 @@ SYSTEM_PROMPT = (
 
 agent = Agent(MODEL, system_prompt=SYSTEM_PROMPT)
 
-def plan_sync(prompt: str) -> dict:
-    # Use a more compatible approach to handle the result
-    result = agent.run_sync(prompt)
-    
-    # Parse the output which might be wrapped in markdown code blocks
-    output = result.output
-    
+def _model_settings(deadline: Optional[Deadline]):
+    # bound the LLM call by whatever is left of the request budget
+    return {"timeout": deadline.timeout("planner")} if deadline else None
+
+async def plan(prompt: str, deadline: Optional[Deadline] = None) -> dict:
+    # Async so the caller can cancel the in-flight LLM request.
+    # The timeout applies per attempt (the OpenAI client retries), so the
+    # caller must also bound the total - see _stage in app.py.
+    result = await agent.run(prompt, model_settings=_model_settings(deadline))
+    return _to_plan(result.output)
+
+def _to_plan(output: str) -> dict:
     # Check if the output is wrapped in markdown code blocks
     import re
     json_match = re.search(r"```(?:json)?\s*(.*?)\s*```", output, re.DOTALL)
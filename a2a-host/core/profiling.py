@@ -0,0 +1,235 @@
+"""
+Opt-in, per-request profiling.
+
+A request is profiled when it carries X-Profile-Key: <PROFILE_KEY>
+(mode chosen with X-Profile-Mode: wall | cpu), or when it is picked by
+PROFILE_SAMPLE_RATE (mode PROFILE_SAMPLE_MODE).
+
+  wall → pyinstrument, sampling + async-aware call tree → speedscope or pstats
+  cpu  → cProfile timed by CPU time                      → pstats
+         (not task-aware: it also counts other requests running at the same
+          time; on Python 3.12+ process CPU time, before that per-thread)
+
+The response gets an X-Profile-Id header; the last PROFILE_KEEP profiles are
+served from GET /admin/profiles (same X-Profile-Key required).
+Without PROFILE_KEY nothing is installed - sampling included, since its
+profiles couldn't be read - and @profiled returns the endpoint unchanged.
+
+thread_cpu_ms in a profile summary is CPU time of the threads that served the
+request while it was in flight. On the event-loop thread that includes other
+requests running concurrently, so it is an upper bound, not the request's cost.
+
+a2a-host and mcp-calendar deploy as separate Heroku apps and can't import
+each other, so each keeps an identical copy of this file
+(a2a-host/core/profiling.py, mcp-calendar/profiling.py). Change both;
+tests/test_profiling.py fails if they drift.
+"""
+import os, sys, time, uuid, hmac, random, marshal, asyncio, threading, functools, contextvars, cProfile, pstats
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+
+PROFILE_KEY = os.environ.get("PROFILE_KEY")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_MODE = os.environ.get("PROFILE_SAMPLE_MODE", "wall")
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_S", "0.001"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+
+# Profiles are only readable with the key, so without one stay off entirely
+ENABLED = bool(PROFILE_KEY)
+if PROFILE_SAMPLE_RATE > 0 and not PROFILE_KEY:
+    print("WARNING: PROFILE_SAMPLE_RATE is set but PROFILE_KEY is not; request profiling is disabled")
+MODES = ("wall", "cpu")
+
+_recent = deque(maxlen=PROFILE_KEEP)
+_current = contextvars.ContextVar("profile_capture", default=None)
+# Both profilers own the profile hook, so capture one request at a time
+_busy = threading.Lock()
+
+# From 3.12 cProfile sits on sys.monitoring: one profiler sees every thread and
+# a second one can't be enabled. Before that it only sees the thread it's on.
+_CPROFILE_ALL_THREADS = sys.version_info >= (3, 12)
+_CPU_TIMER = time.process_time if _CPROFILE_ALL_THREADS else time.thread_time
+
+class _Capture:
+    def __init__(self, mode: str, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.time()
+        self.wall_ms = 0.0
+        self.thread_cpu_ms = 0.0
+        self._sessions = []   # pyinstrument sessions (wall), one per thread
+        self._stats = None    # pstats.Stats (cpu), merged across threads
+        self._cpu_profiling = False
+
+    @contextmanager
+    def on_this_thread(self, async_mode: str = "disabled"):
+        """Profile whatever runs on the current thread inside the block."""
+        cpu0 = time.thread_time()
+        if self.mode == "cpu":
+            if _CPROFILE_ALL_THREADS and self._cpu_profiling:
+                prof = None  # the request's profiler already covers this thread
+            else:
+                prof = cProfile.Profile(_CPU_TIMER)
+                prof.enable()
+                self._cpu_profiling = True
+        else:
+            from pyinstrument import Profiler
+            prof = Profiler(interval=PROFILE_INTERVAL_S, async_mode=async_mode)
+            prof.start()
+        try:
+            yield
+        finally:
+            if self.mode == "cpu":
+                if prof is not None:
+                    prof.disable()
+                    self._cpu_profiling = False
+                    if self._stats is None:
+                        self._stats = pstats.Stats(prof)
+                    else:
+                        self._stats.add(prof)
+            else:
+                self._sessions.append(prof.stop())
+            self.thread_cpu_ms += (time.thread_time() - cpu0) * 1000
+
+    def _session(self):
+        from pyinstrument.session import Session
+        return functools.reduce(Session.combine, self._sessions)
+
+    def speedscope(self) -> bytes:
+        from pyinstrument.renderers import SpeedscopeRenderer
+        return SpeedscopeRenderer().render(self._session()).encode()
+
+    def pstats(self) -> bytes:
+        if self.mode == "cpu":
+            return marshal.dumps(self._stats.stats)
+        from pyinstrument.renderers import PstatsRenderer
+        out = PstatsRenderer().render(self._session())
+        return out if isinstance(out, bytes) else out.encode("utf-8", "surrogateescape")
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started": self.started,
+            "wall_ms": round(self.wall_ms, 1),
+            "thread_cpu_ms": round(self.thread_cpu_ms, 1),
+        }
+
+def _key_ok(key) -> bool:
+    return bool(PROFILE_KEY) and key is not None and hmac.compare_digest(key.encode(), PROFILE_KEY.encode())
+
+def _select(scope) -> Optional[str]:
+    """Profiling mode for this request, or None to leave it alone."""
+    if scope["path"].startswith(router.prefix):
+        return None
+    key = mode = None
+    for name, value in scope["headers"]:
+        if name == b"x-profile-key":
+            key = value.decode("latin-1")
+        elif name == b"x-profile-mode":
+            mode = value.decode("latin-1")
+    if key is not None and _key_ok(key):
+        return mode if mode in MODES else "wall"
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return PROFILE_SAMPLE_MODE if PROFILE_SAMPLE_MODE in MODES else "wall"
+    return None
+
+class ProfilingMiddleware:
+    """Plain ASGI middleware; unselected requests pass straight through."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        mode = _select(scope) if scope["type"] == "http" else None
+        if mode is None or not _busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        cap = _Capture(mode, scope["method"], scope["path"])
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                cap.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", cap.id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(cap)
+        t0 = time.perf_counter()
+        try:
+            with cap.on_this_thread(async_mode="enabled"):
+                await self.app(scope, receive, send_with_id)
+        finally:
+            cap.wall_ms = (time.perf_counter() - t0) * 1000
+            _current.reset(token)
+            _busy.release()
+            _recent.append(cap)
+
+def profiled(fn):
+    """
+    For sync endpoints: FastAPI runs them in a worker thread the middleware's
+    profiler can't see, so profile the body there too.
+    """
+    if not ENABLED or asyncio.iscoroutinefunction(fn):
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        cap = _current.get()
+        if cap is None:
+            return fn(*args, **kwargs)
+        with cap.on_this_thread():
+            return fn(*args, **kwargs)
+    return wrapper
+
+# =========================
+# Admin endpoints
+# =========================
+router = APIRouter(prefix="/admin/profiles")
+
+def _require_key(x_profile_key: Optional[str]):
+    if not _key_ok(x_profile_key):
+        raise HTTPException(status_code=401, detail="Bad profile key")
+
+@router.get("")
+def list_profiles(x_profile_key: Optional[str] = Header(None)):
+    _require_key(x_profile_key)
+    return {"profiles": [c.summary() for c in reversed(_recent)]}
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str, format: str = "speedscope", x_profile_key: Optional[str] = Header(None)):
+    """format: speedscope (wall only, open at https://www.speedscope.app) | pstats"""
+    _require_key(x_profile_key)
+    cap = next((c for c in _recent if c.id == profile_id), None)
+    if cap is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+
+    if format == "speedscope":
+        if cap.mode != "wall":
+            raise HTTPException(status_code=400, detail="CPU profiles are only available as pstats")
+        body, media_type = cap.speedscope(), "application/json"
+    elif format == "pstats":
+        body, media_type = cap.pstats(), "application/octet-stream"
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+
+    filename = f"{cap.id}.{'speedscope.json' if format == 'speedscope' else 'pstats'}"
+    return Response(body, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def install(app):
+    """Wire profiling into a FastAPI app (does nothing unless enabled)."""
+    if not ENABLED:
+        return
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(router)
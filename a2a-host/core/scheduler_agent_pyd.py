@@ -1,6 +1,8 @@
 import os, json
 from pydantic_ai import Agent
+from typing import Optional
 from core.models import ScheduleDecision
+from core.deadline import Deadline
 
 # Bridge Heroku Inference → OpenAI-compatible env
 if os.getenv("INFERENCE_KEY") and not os.getenv("OPENAI_API_KEY"):
@@ -24,12 +26,18 @@ SYSTEM_PROMPT = (
 
 agent = Agent(MODEL, system_prompt=SYSTEM_PROMPT)
 
-def scheduler_agent(planner_json: str) -> str:
-    result = agent.run_sync(planner_json)
-    
-    # Parse the output which might be wrapped in markdown code blocks
-    output = result.output
-    
+def _model_settings(deadline: Optional[Deadline]):
+    # bound the LLM call by whatever is left of the request budget
+    return {"timeout": deadline.timeout("scheduler")} if deadline else None
+
+async def schedule(planner_json: str, deadline: Optional[Deadline] = None) -> str:
+    # Async so the caller can cancel the in-flight LLM request.
+    # The timeout applies per attempt (the OpenAI client retries), so the
+    # caller must also bound the total - see _stage in app.py.
+    result = await agent.run(planner_json, model_settings=_model_settings(deadline))
+    return _to_decision(result.output)
+
+def _to_decision(output: str) -> str:
     # Check if the output is wrapped in markdown code blocks
     import re
     json_match = re.search(r"```(?:json)?\s*(.*?)\s*```", output, re.DOTALL)
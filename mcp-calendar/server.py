@@ -6,10 +6,15 @@ from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from urllib.parse import urlencode
 import uuid
+import time
+
+import profiling
+from profiling import profiled
 
 TOOLS_KEY = os.environ.get("TOOLS_KEY")
 
 app = FastAPI()
+profiling.install(app)  # opt-in request profiling (PROFILE_KEY / PROFILE_SAMPLE_RATE)
 
 GOOGLE_CLIENT_ID = os.environ["GOOGLE_CLIENT_ID"]
 GOOGLE_CLIENT_SECRET = os.environ["GOOGLE_CLIENT_SECRET"]
@@ -20,14 +25,41 @@ GOOGLE_SCOPES = "https://www.googleapis.com/auth/calendar.events https://www.goo
 
 GOOGLE_REFRESH_TOKEN = os.environ["GOOGLE_REFRESH_TOKEN"]
 
-def _get_access_token():
+# Per-call cap on Google requests; a caller's X-Deadline-Ms can only shorten it
+GOOGLE_TIMEOUT_S = 30
+
+def _deadline_at(x_deadline_ms: Optional[int]) -> Optional[float]:
+    """Turn the caller's remaining budget (ms) into an absolute monotonic deadline."""
+    if x_deadline_ms is None:
+        return None
+    return time.monotonic() + x_deadline_ms / 1000
+
+def _timeout(deadline_at: Optional[float], stage: str) -> float:
+    """Timeout for the next Google call, or 504 naming the stage if the budget is gone."""
+    if deadline_at is None:
+        return GOOGLE_TIMEOUT_S
+    left = deadline_at - time.monotonic()
+    if left <= 0:
+        raise HTTPException(status_code=504, detail={"error": "deadline_exceeded", "stage": stage})
+    return min(left, GOOGLE_TIMEOUT_S)
+
+def _google_post(stage: str, deadline_at: Optional[float], url: str, **kwargs):
+    try:
+        return requests.post(url, timeout=_timeout(deadline_at, stage), **kwargs)
+    except requests.exceptions.Timeout:
+        if deadline_at is not None and time.monotonic() >= deadline_at:
+            raise HTTPException(status_code=504, detail={"error": "deadline_exceeded", "stage": stage})
+        # Google was slow, but the caller's budget isn't what ran out
+        raise HTTPException(status_code=502, detail=f"{stage} timed out after {GOOGLE_TIMEOUT_S}s")
+
+def _get_access_token(deadline_at: Optional[float] = None):
     data = {
         "client_id": GOOGLE_CLIENT_ID,
         "client_secret": GOOGLE_CLIENT_SECRET,
         "refresh_token": GOOGLE_REFRESH_TOKEN,
         "grant_type": "refresh_token",
     }
-    r = requests.post("https://oauth2.googleapis.com/token", data=data, timeout=30)
+    r = _google_post("google.token", deadline_at, "https://oauth2.googleapis.com/token", data=data)
     r.raise_for_status()
     return r.json()["access_token"]
 
@@ -132,15 +164,19 @@ def tools_list():
     }
 
 @app.post("/tools/call")
-def tools_call(body: CallBody, x_tool_key: Optional[str]=Header(None)):
+@profiled
+def tools_call(body: CallBody, x_tool_key: Optional[str]=Header(None), x_deadline_ms: Optional[int]=Header(None)):
     #simple auth: require the shared secret header
     if TOOLS_KEY and x_tool_key != TOOLS_KEY:
         raise HTTPException(status_code=401, detail="Bad tool key")
 
+    #remaining budget forwarded by a2a-host (absent → plain per-call timeouts)
+    deadline_at = _deadline_at(x_deadline_ms)
+
     #handle the tool by name
     if body.name == "calendar.freebusy":
         args = body.arguments
-        access_token = _get_access_token()
+        access_token = _get_access_token(deadline_at)
         headers = {
                     "Authorization": f"Bearer {access_token}",
                     "Content-Type": "application/json",
@@ -153,8 +189,9 @@ def tools_call(body: CallBody, x_tool_key: Optional[str]=Header(None)):
         "timeZone": args["time_zone"],
         "items": [{"id": "primary"}],       # check your primary calendar
     }
-        r = requests.post("https://www.googleapis.com/calendar/v3/freeBusy",
-                      headers=headers, json=payload, timeout=30)
+        r = _google_post("google.freebusy", deadline_at,
+                         "https://www.googleapis.com/calendar/v3/freeBusy",
+                         headers=headers, json=payload)
         if not r.ok:
             raise HTTPException(status_code=502, detail=f"FreeBusy failed: {r.text}")
         data = r.json()
@@ -166,7 +203,7 @@ def tools_call(body: CallBody, x_tool_key: Optional[str]=Header(None)):
 
     elif body.name == "calendar.create_event":
         args = body.arguments
-        access_token = _get_access_token()
+        access_token = _get_access_token(deadline_at)
         headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
@@ -202,7 +239,7 @@ def tools_call(body: CallBody, x_tool_key: Optional[str]=Header(None)):
             f"?conferenceDataVersion=1&sendUpdates={send_updates}"
         )
 
-        r = requests.post(url, headers=headers, json=event, timeout=30)
+        r = _google_post("google.events_insert", deadline_at, url, headers=headers, json=event)
         if not r.ok:
             raise HTTPException(status_code=502, detail=f"Events.insert failed: {r.text}")
 
@@ -0,0 +1,251 @@
+import os, sys, time, asyncio
+from pathlib import Path
+
+import pytest
+import requests
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / "a2a-host"), str(ROOT / "mcp-calendar")]
+# both services read their config at import; nothing here talks to the network
+for var, value in {
+    "MCP_CAL_URL": "http://mcp-calendar.test", "TOOLS_KEY": "tools-key",
+    "BASE_URL": "http://llm.test", "API_KEY": "llm-key", "MODEL_NAME": "test-model",
+    "OPENAI_API_KEY": "test-key",
+    "GOOGLE_CLIENT_ID": "id", "GOOGLE_CLIENT_SECRET": "secret",
+    "OAUTH_REDIRECT_URI": "http://localhost/oauth/callback", "GOOGLE_REFRESH_TOKEN": "refresh",
+}.items():
+    os.environ.setdefault(var, value)
+
+import app as host
+import server as mcp
+from core import mcp_client
+from core.deadline import (Deadline, DeadlineExceeded, DEADLINE_HEADER, DEFAULT_DEADLINE_MS,
+                           MAX_DEADLINE_MS, DOWNSTREAM_HEADROOM_MS)
+
+PLAN = {"title": "Sync", "start": "2025-09-13T16:00:00-07:00", "end": "2025-09-13T16:30:00-07:00",
+        "attendees": ["a@example.com"], "time_zone": "America/Los_Angeles"}
+DECISION = '{"action": "CHECK_FREEBUSY", "args": %s, "reason": "looks complete"}' % (
+    '{"start": "%s", "end": "%s"}' % (PLAN["start"], PLAN["end"]))
+
+# =========================
+# Deadline
+# =========================
+def test_from_header_defaults_and_caps():
+    assert Deadline.from_header(None).budget_ms == DEFAULT_DEADLINE_MS
+    assert Deadline.from_header(MAX_DEADLINE_MS * 10).budget_ms == MAX_DEADLINE_MS
+    with pytest.raises(ValueError):
+        Deadline.from_header(0)
+
+def test_timeout_is_capped_and_raises_once_spent():
+    deadline = Deadline(10_000)
+    assert deadline.timeout("planner", cap=2) == 2
+    assert 9 < deadline.timeout("planner") <= 10
+    spent = Deadline(1)
+    time.sleep(0.01)
+    with pytest.raises(DeadlineExceeded) as exc:
+        spent.timeout("scheduler")
+    assert exc.value.stage == "scheduler"
+
+def test_headers_hold_back_headroom():
+    forwarded = int(Deadline(5_000).headers()[DEADLINE_HEADER])
+    assert 5_000 - DOWNSTREAM_HEADROOM_MS - 50 < forwarded <= 5_000 - DOWNSTREAM_HEADROOM_MS
+    assert Deadline(DOWNSTREAM_HEADROOM_MS // 2).headers()[DEADLINE_HEADER] == "1"
+
+# =========================
+# _stage
+# =========================
+class _Request:
+    def __init__(self, disconnected=False):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+def test_stage_returns_result():
+    async def work():
+        return 42
+    assert asyncio.run(host._stage(_Request(), Deadline(1_000), "planner", work())) == 42
+
+def test_stage_cancels_when_budget_runs_out():
+    cancelled = []
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    async def run():
+        await host._stage(_Request(), Deadline(100), "planner", slow())
+        await asyncio.sleep(0)
+    with pytest.raises(DeadlineExceeded) as exc:
+        asyncio.run(run())
+    assert exc.value.stage == "planner"
+    assert cancelled == [True]
+
+def test_stage_relabels_error_after_expiry():
+    async def llm_timeout():
+        time.sleep(0.15)  # the LLM client's own timeout firing at the deadline
+        raise RuntimeError("Request timed out")
+    with pytest.raises(DeadlineExceeded) as exc:
+        asyncio.run(host._stage(_Request(), Deadline(100), "scheduler", llm_timeout()))
+    assert exc.value.stage == "scheduler"
+
+def test_stage_keeps_errors_within_budget():
+    async def broken():
+        raise RuntimeError("bad output")
+    with pytest.raises(RuntimeError):
+        asyncio.run(host._stage(_Request(), Deadline(5_000), "planner", broken()))
+
+def test_stage_stops_on_disconnect():
+    async def slow():
+        await asyncio.sleep(5)
+    t0 = time.monotonic()
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(host._stage(_Request(disconnected=True), Deadline(5_000), "planner", slow()))
+    assert exc.value.status_code == 499
+    assert exc.value.detail["stage"] == "planner"
+    assert time.monotonic() - t0 < 2
+
+# =========================
+# Routes
+# =========================
+@pytest.fixture
+def client(monkeypatch):
+    async def plan(prompt, deadline=None):
+        return dict(PLAN)
+    async def schedule(planner_json, deadline=None):
+        return DECISION
+    monkeypatch.setattr(host, "plan", plan)
+    monkeypatch.setattr(host, "schedule", schedule)
+    monkeypatch.setattr(host, "SIGNING_KEY", "signing-key")
+    return TestClient(host.app)
+
+def _post(client, path, deadline_ms=None):
+    headers = {DEADLINE_HEADER: str(deadline_ms)} if deadline_ms is not None else {}
+    return client.post(path, json={"prompt": "sync tomorrow"}, headers=headers)
+
+def test_plan_passes_deadline_to_freebusy(client, monkeypatch):
+    seen = []
+    def call_tool(name, arguments, deadline=None):
+        seen.append((name, deadline))
+        return {"free": True, "busy": []}
+    monkeypatch.setattr(host, "call_tool", call_tool)
+    r = _post(client, "/a2a/plan", 5_000)
+    assert r.status_code == 200, r.text
+    assert r.json()["status"] == "free"
+    (name, deadline), = seen
+    assert name == "calendar.freebusy" and deadline.budget_ms == 5_000
+
+@pytest.mark.parametrize("path", ["/a2a/plan", "/a2a/dry-run"])
+def test_planner_out_of_budget_is_504(client, monkeypatch, path):
+    async def slow_plan(prompt, deadline=None):
+        await asyncio.sleep(5)
+    monkeypatch.setattr(host, "plan", slow_plan)
+    r = _post(client, path, 200)
+    assert r.status_code == 504
+    assert r.json()["detail"] == {"error": "deadline_exceeded", "stage": "planner"}
+
+def test_zero_budget_is_400(client):
+    assert _post(client, "/a2a/plan", 0).status_code == 400
+
+def test_slow_freebusy_is_504(client, monkeypatch):
+    def slow_call_tool(name, arguments, deadline=None):
+        time.sleep(1)
+        return {"free": True, "busy": []}
+    monkeypatch.setattr(host, "call_tool", slow_call_tool)
+    r = _post(client, "/a2a/plan", 300)
+    assert r.status_code == 504
+    assert r.json()["detail"]["stage"] == "calendar.freebusy"
+
+def test_confirm_is_not_cut_off_by_deadline(client, monkeypatch):
+    seen = []
+    def call_tool(name, arguments, deadline=None):
+        seen.append(deadline)
+        return {"event_id": "evt"}
+    monkeypatch.setattr(host, "call_tool", call_tool)
+    token = host._make_token(dict(PLAN))
+    r = client.post("/a2a/confirm", json={"token": token}, headers={DEADLINE_HEADER: "1"})
+    assert r.status_code == 200, r.text
+    assert seen == [None]
+
+# =========================
+# call_tool (a2a-host → mcp-calendar)
+# =========================
+class _Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}")
+
+FREEBUSY_ARGS = {"start": PLAN["start"], "end": PLAN["end"], "time_zone": PLAN["time_zone"]}
+
+def test_call_tool_forwards_budget_less_headroom(monkeypatch):
+    sent = {}
+    def post(url, json, headers, timeout):
+        sent.update(headers=headers, timeout=timeout)
+        return _Response(200, {"content": {"free": True, "busy": []}})
+    monkeypatch.setattr(mcp_client.requests, "post", post)
+    assert mcp_client.call_tool("calendar.freebusy", FREEBUSY_ARGS, Deadline(5_000)) == {"free": True, "busy": []}
+    assert int(sent["headers"][DEADLINE_HEADER]) <= sent["timeout"] * 1000 - DOWNSTREAM_HEADROOM_MS
+
+def test_call_tool_names_downstream_stage(monkeypatch):
+    def post(url, json, headers, timeout):
+        return _Response(504, {"detail": {"error": "deadline_exceeded", "stage": "google.token"}})
+    monkeypatch.setattr(mcp_client.requests, "post", post)
+    with pytest.raises(DeadlineExceeded) as exc:
+        mcp_client.call_tool("calendar.freebusy", FREEBUSY_ARGS, Deadline(5_000))
+    assert exc.value.stage == "calendar.freebusy:google.token"
+
+def test_call_tool_timeout_after_expiry_is_not_busy(monkeypatch):
+    def post(url, json, headers, timeout):
+        time.sleep(timeout)
+        raise requests.exceptions.ReadTimeout()
+    monkeypatch.setattr(mcp_client.requests, "post", post)
+    with pytest.raises(DeadlineExceeded):
+        mcp_client.call_tool("calendar.freebusy", FREEBUSY_ARGS, Deadline(50))
+
+def test_call_tool_without_deadline_keeps_busy_fallback(monkeypatch):
+    def post(url, json, headers, timeout):
+        assert DEADLINE_HEADER not in headers and timeout == 30
+        raise requests.exceptions.ConnectionError()
+    monkeypatch.setattr(mcp_client.requests, "post", post)
+    assert mcp_client.call_tool("calendar.freebusy", FREEBUSY_ARGS)["free"] is False
+
+# =========================
+# mcp-calendar Google calls
+# =========================
+@pytest.fixture
+def google_times_out(monkeypatch):
+    def post(url, timeout, **kwargs):
+        time.sleep(min(timeout, 0.01))  # the real timeout is 30s; don't wait for it
+        raise requests.exceptions.ReadTimeout()
+    monkeypatch.setattr(mcp.requests, "post", post)
+
+def test_google_timeout_after_budget_is_504(google_times_out):
+    with pytest.raises(HTTPException) as exc:
+        mcp._google_post("google.freebusy", time.monotonic() + 0.001, "https://google.test")
+    assert exc.value.status_code == 504
+    assert exc.value.detail == {"error": "deadline_exceeded", "stage": "google.freebusy"}
+
+@pytest.mark.parametrize("budget_s", [None, 10])
+def test_google_timeout_with_budget_left_is_502(google_times_out, budget_s):
+    deadline_at = None if budget_s is None else time.monotonic() + budget_s
+    with pytest.raises(HTTPException) as exc:
+        mcp._google_post("google.freebusy", deadline_at, "https://google.test")
+    assert exc.value.status_code == 502
+
+def test_spent_budget_skips_google(monkeypatch):
+    def post(*args, **kwargs):
+        raise AssertionError("Google should not be called")
+    monkeypatch.setattr(mcp.requests, "post", post)
+    with pytest.raises(HTTPException) as exc:
+        mcp._google_post("google.token", time.monotonic() - 1, "https://google.test")
+    assert exc.value.status_code == 504 and exc.value.detail["stage"] == "google.token"
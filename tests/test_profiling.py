@@ -0,0 +1,119 @@
+import time, pstats, importlib.util
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parents[1]
+# The two services deploy as separate apps, so each carries its own copy
+COPIES = {
+    "a2a-host": ROOT / "a2a-host" / "core" / "profiling.py",
+    "mcp-calendar": ROOT / "mcp-calendar" / "profiling.py",
+}
+KEY = "test-profile-key"
+
+def _load(name: str, monkeypatch, **env):
+    # settings are read at import, so load a fresh module per environment
+    for var in ("PROFILE_KEY", "PROFILE_SAMPLE_RATE", "PROFILE_SAMPLE_MODE"):
+        monkeypatch.delenv(var, raising=False)
+    for var, value in env.items():
+        monkeypatch.setenv(var, value)
+    spec = importlib.util.spec_from_file_location(f"profiling_{name.replace('-', '_')}", COPIES[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _client(profiling):
+    app = FastAPI()
+    profiling.install(app)
+
+    @app.get("/sync")
+    @profiling.profiled
+    def sync_endpoint():
+        t0 = time.thread_time()
+        while time.thread_time() - t0 < 0.02:
+            pass
+        return {"ok": True}
+
+    @app.get("/async")
+    async def async_endpoint():
+        return {"ok": True}
+
+    return TestClient(app)
+
+@pytest.fixture(params=list(COPIES))
+def client(request, monkeypatch):
+    return _client(_load(request.param, monkeypatch, PROFILE_KEY=KEY))
+
+def _profile(client, path, mode):
+    r = client.get(path, headers={"X-Profile-Key": KEY, "X-Profile-Mode": mode})
+    assert r.status_code == 200, r.text
+    profile_id = r.headers["x-profile-id"]
+    listed = client.get("/admin/profiles", headers={"X-Profile-Key": KEY}).json()["profiles"]
+    summary = next(p for p in listed if p["id"] == profile_id)
+    assert summary["status"] == 200
+    assert summary["mode"] == mode
+    assert summary["wall_ms"] > 0 and "thread_cpu_ms" in summary
+    return profile_id
+
+def _pstats(client, profile_id, tmp_path):
+    r = client.get(f"/admin/profiles/{profile_id}", params={"format": "pstats"},
+                   headers={"X-Profile-Key": KEY})
+    assert r.status_code == 200
+    path = tmp_path / "profile.pstats"
+    path.write_bytes(r.content)
+    return pstats.Stats(str(path))
+
+@pytest.mark.parametrize("path", ["/sync", "/async"])
+def test_cpu_mode(client, path, tmp_path):
+    profile_id = _profile(client, path, "cpu")
+    stats = _pstats(client, profile_id, tmp_path)
+    names = {func for (_, _, func) in stats.stats}
+    if path == "/sync":
+        assert "sync_endpoint" in names
+
+@pytest.mark.parametrize("path", ["/sync", "/async"])
+def test_wall_mode(client, path, tmp_path):
+    profile_id = _profile(client, path, "wall")
+    r = client.get(f"/admin/profiles/{profile_id}", params={"format": "speedscope"},
+                   headers={"X-Profile-Key": KEY})
+    assert r.status_code == 200
+    assert "profiles" in r.json()
+    _pstats(client, profile_id, tmp_path)
+
+def test_unprofiled_request_has_no_profile_id(client):
+    r = client.get("/sync")
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+
+def test_admin_requires_key(client):
+    assert client.get("/admin/profiles").status_code == 401
+    assert client.get("/admin/profiles", headers={"X-Profile-Key": "nope"}).status_code == 401
+
+@pytest.mark.parametrize("name", list(COPIES))
+@pytest.mark.parametrize("mode", ["wall", "cpu"])
+def test_sampled_requests_are_readable(name, mode, monkeypatch, tmp_path):
+    profiling = _load(name, monkeypatch, PROFILE_KEY=KEY,
+                      PROFILE_SAMPLE_RATE="1", PROFILE_SAMPLE_MODE=mode)
+    client = _client(profiling)
+    r = client.get("/sync")  # no X-Profile-Key: picked by the sample rate
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+    listed = client.get("/admin/profiles", headers={"X-Profile-Key": KEY}).json()["profiles"]
+    assert [p["mode"] for p in listed if p["id"] == profile_id] == [mode]
+    _pstats(client, profile_id, tmp_path)
+
+@pytest.mark.parametrize("name", list(COPIES))
+def test_sampling_without_key_stays_off(name, monkeypatch):
+    profiling = _load(name, monkeypatch, PROFILE_SAMPLE_RATE="1")
+    assert not profiling.ENABLED
+    client = _client(profiling)
+    r = client.get("/sync")
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+    assert client.get("/admin/profiles").status_code == 404
+
+def test_copies_in_sync():
+    a2a, mcp = (p.read_text() for p in COPIES.values())
+    assert a2a == mcp, "a2a-host/core/profiling.py and mcp-calendar/profiling.py have drifted"